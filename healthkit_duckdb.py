@@ -7,14 +7,26 @@ optimized for LLM-based natural language queries.
 """
 
 import argparse
+import functools
 import time
-import xml.etree.ElementTree as ET
-from datetime import datetime
 from pathlib import Path
 
 import duckdb
+import pyarrow as pa
+from lxml import etree
 
 
+# Apple identifier prefixes stripped by normalize_type
+_TYPE_PREFIXES = (
+    "HKQuantityTypeIdentifier",
+    "HKCategoryTypeIdentifier",
+    "HKDataType",
+    "HKWorkoutActivityType",
+)
+
+
+# Few distinct identifiers repeat across millions of rows, so memoize
+@functools.lru_cache(maxsize=None)
 def normalize_type(raw_type: str) -> str:
     """
     Strip verbose Apple prefixes to make types LLM-friendly.
@@ -24,13 +36,7 @@ def normalize_type(raw_type: str) -> str:
         HKQuantityTypeIdentifierStepCount → StepCount
         HKWorkoutActivityTypeRunning → WorkoutRunning
     """
-    prefixes = [
-        "HKQuantityTypeIdentifier",
-        "HKCategoryTypeIdentifier",
-        "HKDataType",
-        "HKWorkoutActivityType",
-    ]
-    for prefix in prefixes:
+    for prefix in _TYPE_PREFIXES:
         if raw_type.startswith(prefix):
             result = raw_type[len(prefix):]
             # For workouts, prepend "Workout" to distinguish from records
@@ -40,20 +46,14 @@ def normalize_type(raw_type: str) -> str:
     return raw_type
 
 
-def parse_timestamp(ts_str: str) -> datetime | None:
-    """Parse Apple Health timestamp format."""
-    if not ts_str:
-        return None
-    try:
-        # Format: 2024-01-15 08:30:00 -0600
-        return datetime.strptime(ts_str[:19], "%Y-%m-%d %H:%M:%S")
-    except ValueError:
-        return None
+# Characters a numeric value can start with; anything else (e.g. an
+# HKCategoryValue... string) skips float() and its ValueError entirely
+_NUMBER_START = frozenset("0123456789-+.")
 
 
 def parse_float(val: str) -> float | None:
     """Safely parse a float value."""
-    if not val:
+    if not val or val[0] not in _NUMBER_START:
         return None
     try:
         return float(val)
@@ -61,6 +61,34 @@ def parse_float(val: str) -> float | None:
         return None
 
 
+# Workout unit conversion factors, keyed by Apple's unit strings
+_DURATION_TO_MIN = {"s": 1 / 60, "sec": 1 / 60, "min": 1.0, "hr": 60.0}
+_DISTANCE_TO_KM = {"mi": 1.60934, "km": 1.0, "m": 0.001}
+
+
+def duration_factor(unit: str) -> float:
+    """Multiplier converting a workout duration in `unit` to minutes."""
+    factor = _DURATION_TO_MIN.get(unit)
+    if factor is None:
+        # Unseen spelling - resolve it once and remember the answer
+        factor = _DURATION_TO_MIN.get(unit.lower())
+        if factor is None:
+            factor = 1 / 60 if "sec" in unit.lower() else 1.0
+        _DURATION_TO_MIN[unit] = factor
+    return factor
+
+
+def distance_factor(unit: str) -> float:
+    """Multiplier converting a workout distance in `unit` to kilometers."""
+    factor = _DISTANCE_TO_KM.get(unit)
+    if factor is None:
+        factor = _DISTANCE_TO_KM.get(unit.lower())
+        if factor is None:
+            factor = 1.60934 if "mi" in unit.lower() else 1.0
+        _DISTANCE_TO_KM[unit] = factor
+    return factor
+
+
 def create_table(conn: duckdb.DuckDBPyConnection) -> None:
     """Create the health table schema."""
     conn.execute("""
@@ -78,6 +106,27 @@ def create_table(conn: duckdb.DuckDBPyConnection) -> None:
     """)
 
 
+# Bytes buffered per read of export.xml
+READ_BUFFER_SIZE = 1 << 20
+
+# Elements parsed between prunes of the document root
+PRUNE_INTERVAL = 10000
+
+# Schema of the Arrow staging table - mirrors the health table columns,
+# except timestamps stay as raw strings and are cast by DuckDB on insert
+SCHEMA = pa.schema([
+    ("type", pa.string()),
+    ("value", pa.float64()),
+    ("unit", pa.string()),
+    ("start_date", pa.string()),
+    ("end_date", pa.string()),
+    ("duration_min", pa.float64()),
+    ("distance_km", pa.float64()),
+    ("energy_kcal", pa.float64()),
+    ("source_name", pa.string()),
+])
+
+
 def parse_and_load(xml_path: Path, db_path: Path, batch_size: int = 50000, progress_interval: int = 100000) -> dict:
     """
     Parse export.xml and load into DuckDB.
@@ -90,7 +139,17 @@ def parse_and_load(xml_path: Path, db_path: Path, batch_size: int = 50000, progr
     conn = duckdb.connect(str(db_path))
     create_table(conn)
 
-    batch = []
+    # Column arrays for batch processing
+    types = []
+    values = []
+    units = []
+    start_dates = []
+    end_dates = []
+    duration_mins = []
+    distance_kms = []
+    energy_kcals = []
+    source_names = []
+
     stats = {"records": 0, "workouts": 0, "errors": 0}
     start_time = time.time()
     last_progress = 0
@@ -106,78 +165,128 @@ def parse_and_load(xml_path: Path, db_path: Path, batch_size: int = 50000, progr
               f"in {elapsed:.1f}s ({rate:,.0f} rows/sec)")
 
     def flush_batch():
-        if batch:
-            conn.executemany("""
-                INSERT INTO health VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, batch)
-            batch.clear()
+        nonlocal types, values, units, start_dates, end_dates
+        nonlocal duration_mins, distance_kms, energy_kcals, source_names
+
+        if not types:
+            return
+
+        table = pa.table({
+            "type": types,
+            "value": values,
+            "unit": units,
+            "start_date": start_dates,
+            "end_date": end_dates,
+            "duration_min": duration_mins,
+            "distance_km": distance_kms,
+            "energy_kcal": energy_kcals,
+            "source_name": source_names,
+        }, schema=SCHEMA)
+
+        # DuckDB scans the registered Arrow table directly (zero-copy)
+        conn.register("stage", table)
+        # Format: 2024-01-15 08:30:00 (offset already sliced off)
+        conn.execute("""
+            INSERT INTO health
+            SELECT
+                type,
+                value,
+                unit,
+                TRY_CAST(start_date AS TIMESTAMP),
+                TRY_CAST(end_date AS TIMESTAMP),
+                duration_min,
+                distance_km,
+                energy_kcal,
+                source_name
+            FROM stage
+        """)
+        conn.unregister("stage")
+
+        # Clear arrays
+        types = []
+        values = []
+        units = []
+        start_dates = []
+        end_dates = []
+        duration_mins = []
+        distance_kms = []
+        energy_kcals = []
+        source_names = []
 
     print("Starting parse...")
 
-    # Use iterparse for streaming - only trigger on end events
-    context = ET.iterparse(str(xml_path), events=("end",))
-
-    for event, elem in context:
-        try:
-            if elem.tag == "Record":
-                row = (
-                    normalize_type(elem.get("type", "")),
-                    parse_float(elem.get("value")),
-                    elem.get("unit"),
-                    parse_timestamp(elem.get("startDate")),
-                    parse_timestamp(elem.get("endDate")),
-                    None,  # duration_min
-                    None,  # distance_km
-                    None,  # energy_kcal
-                    elem.get("sourceName"),
-                )
-                batch.append(row)
-                stats["records"] += 1
-
-            elif elem.tag == "Workout":
-                # Calculate duration in minutes
-                duration_min = None
-                duration_str = elem.get("duration")
-                if duration_str:
-                    duration_min = parse_float(duration_str)
-                    duration_unit = elem.get("durationUnit", "")
-                    if "sec" in duration_unit.lower():
-                        duration_min = duration_min / 60 if duration_min else None
-
-                # Get distance (convert to km if needed)
-                distance_km = parse_float(elem.get("totalDistance"))
-                distance_unit = elem.get("totalDistanceUnit", "")
-                if distance_km and "mi" in distance_unit.lower():
-                    distance_km *= 1.60934
-
-                row = (
-                    normalize_type(elem.get("workoutActivityType", "")),
-                    None,  # value
-                    None,  # unit
-                    parse_timestamp(elem.get("startDate")),
-                    parse_timestamp(elem.get("endDate")),
-                    duration_min,
-                    distance_km,
-                    parse_float(elem.get("totalEnergyBurned")),
-                    elem.get("sourceName"),
-                )
-                batch.append(row)
-                stats["workouts"] += 1
-
-            # Flush batch periodically
-            if len(batch) >= batch_size:
-                flush_batch()
-
-            # Progress update
-            if total_rows() - last_progress >= progress_interval:
-                print_progress()
-                last_progress = total_rows()
-
-        except Exception as e:
-            stats["errors"] += 1
-
-        # Clear element to keep memory flat
-        elem.clear()
+    # Use lxml's iterparse for streaming - only trigger on the tags we load.
+    # Read through a large buffer so big exports on slow disks take fewer
+    # read syscalls than libxml2's default small reads.
+    with open(xml_path, "rb", buffering=READ_BUFFER_SIZE) as xml_file:
+        context = etree.iterparse(xml_file, events=("end",), tag=("Record", "Workout"))
+
+        since_prune = 0
+        for event, elem in context:
+            try:
+                if elem.tag == "Record":
+                    attrs = elem.attrib
+                    types.append(normalize_type(attrs.get("type", "")))
+                    values.append(parse_float(attrs.get("value")))
+                    units.append(attrs.get("unit"))
+                    start_date = attrs.get("startDate")
+                    start_dates.append(start_date[:19] if start_date else None)
+                    end_date = attrs.get("endDate")
+                    end_dates.append(end_date[:19] if end_date else None)
+                    duration_mins.append(None)
+                    distance_kms.append(None)
+                    energy_kcals.append(None)
+                    source_names.append(attrs.get("sourceName"))
+                    stats["records"] += 1
+
+                elif elem.tag == "Workout":
+                    attrs = elem.attrib
+                    # Calculate duration in minutes
+                    duration_min = parse_float(attrs.get("duration"))
+                    if duration_min:
+                        duration_min *= duration_factor(attrs.get("durationUnit", ""))
+
+                    # Get distance (convert to km if needed)
+                    distance_km = parse_float(attrs.get("totalDistance"))
+                    if distance_km:
+                        distance_km *= distance_factor(attrs.get("totalDistanceUnit", ""))
+
+                    types.append(normalize_type(attrs.get("workoutActivityType", "")))
+                    values.append(None)
+                    units.append(None)
+                    start_date = attrs.get("startDate")
+                    start_dates.append(start_date[:19] if start_date else None)
+                    end_date = attrs.get("endDate")
+                    end_dates.append(end_date[:19] if end_date else None)
+                    duration_mins.append(duration_min)
+                    distance_kms.append(distance_km)
+                    energy_kcals.append(parse_float(attrs.get("totalEnergyBurned")))
+                    source_names.append(attrs.get("sourceName"))
+                    stats["workouts"] += 1
+
+                # Flush batch periodically
+                if len(types) >= batch_size:
+                    flush_batch()
+
+                # Progress update
+                if total_rows() - last_progress >= progress_interval:
+                    print_progress()
+                    last_progress = total_rows()
+
+            except Exception as e:
+                stats["errors"] += 1
+
+            # Clear element to keep memory flat. Finished siblings are detached
+            # in bulk by clearing the root every PRUNE_INTERVAL elements, rather
+            # than walking previous siblings on every row. Only prune between
+            # top-level elements so an open Correlation is never cut loose.
+            elem.clear()
+            since_prune += 1
+            if since_prune >= PRUNE_INTERVAL:
+                parent = elem.getparent()
+                if parent is not None and parent.getparent() is None:
+                    parent.clear()
+                    since_prune = 0
 
     # Final flush
     flush_batch()
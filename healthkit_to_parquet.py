@@ -7,9 +7,14 @@ Extracts starting GPS coordinates from workout route GPX files.
 """
 
 import argparse
+import functools
+import re
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from xml.parsers import expat
 
+import numpy as np
 import pyarrow as pa
 import pyarrow.parquet as pq
 from lxml import etree
@@ -17,16 +22,44 @@ from lxml import etree
 # GPX namespace - Apple uses GPX 1.1
 GPX_NS = {"gpx": "http://www.topografix.com/GPX/1/1"}
 
+# The first <trkpt> tag and its coordinates (attribute order varies
+# between GPX writers, so lat and lon are matched separately)
+TRKPT_RE = re.compile(rb"<trkpt\b([^>]*)>")
+TRKPT_LAT_RE = re.compile(rb"\blat=[\"']([^\"']+)[\"']")
+TRKPT_LON_RE = re.compile(rb"\blon=[\"']([^\"']+)[\"']")
 
+# Bytes read from the start of a GPX file when looking for the first <trkpt>
+GPX_HEAD_BYTES = 8192
+
+# Bytes of export.xml read and handed to the parser at a time
+READ_BUFFER_SIZE = 1 << 20
+
+# Threads used to read workout GPX files (IO-bound, so more than cores is fine)
+GPX_WORKERS = 8
+
+
+# Apple identifier prefixes stripped by normalize_type
+_TYPE_PREFIXES = (
+    "HKQuantityTypeIdentifier",
+    "HKCategoryTypeIdentifier",
+    "HKDataType",
+    "HKWorkoutActivityType",
+)
+
+# Category value prefixes, most specific first
+_CATEGORY_PREFIXES = (
+    "HKCategoryValueSleepAnalysis",
+    "HKCategoryValueAppleStandHour",
+    "HKCategoryValueEnvironmentalAudioExposureEvent",
+    "HKCategoryValue",
+)
+
+
+# Few distinct identifiers repeat across millions of rows, so memoize
+@functools.lru_cache(maxsize=None)
 def normalize_type(raw_type: str) -> str:
     """Strip verbose Apple prefixes to make types LLM-friendly."""
-    prefixes = [
-        "HKQuantityTypeIdentifier",
-        "HKCategoryTypeIdentifier",
-        "HKDataType",
-        "HKWorkoutActivityType",
-    ]
-    for prefix in prefixes:
+    for prefix in _TYPE_PREFIXES:
         if raw_type.startswith(prefix):
             result = raw_type[len(prefix):]
             if prefix == "HKWorkoutActivityType":
@@ -35,27 +68,28 @@ def normalize_type(raw_type: str) -> str:
     return raw_type
 
 
+@functools.lru_cache(maxsize=None)
 def normalize_category_value(raw_value: str) -> str | None:
     """Strip verbose Apple prefixes from category values."""
     if not raw_value:
         return None
-
-    prefixes = [
-        "HKCategoryValueSleepAnalysis",
-        "HKCategoryValueAppleStandHour",
-        "HKCategoryValueEnvironmentalAudioExposureEvent",
-        "HKCategoryValue",
-    ]
-    for prefix in prefixes:
+    for prefix in _CATEGORY_PREFIXES:
         if raw_value.startswith(prefix):
             return raw_value[len(prefix):]
     return raw_value
 
 
+# Characters a numeric value can start with; anything else (e.g. an
+# HKCategoryValue... string) skips float() and its ValueError entirely
+_NUMBER_START = frozenset("0123456789-+.")
+
+
 def parse_value(val: str) -> tuple[float | None, str | None]:
     """Parse value field, returning (numeric_value, category_value)."""
     if not val:
         return None, None
+    if val[0] not in _NUMBER_START:
+        return None, normalize_category_value(val)
     try:
         return float(val), None
     except ValueError:
@@ -64,7 +98,7 @@ def parse_value(val: str) -> tuple[float | None, str | None]:
 
 def parse_float(val: str) -> float | None:
     """Safely parse a float value."""
-    if not val:
+    if not val or val[0] not in _NUMBER_START:
         return None
     try:
         return float(val)
@@ -72,17 +106,73 @@ def parse_float(val: str) -> float | None:
         return None
 
 
-def get_gpx_start_point(gpx_path: Path) -> tuple[float | None, float | None]:
+# Workout unit conversion factors, keyed by Apple's unit strings
+_DURATION_TO_MIN = {"s": 1 / 60, "sec": 1 / 60, "min": 1.0, "hr": 60.0}
+_DISTANCE_TO_KM = {"mi": 1.60934, "km": 1.0, "m": 0.001}
+
+
+def duration_factor(unit: str) -> float:
+    """Multiplier converting a workout duration in `unit` to minutes."""
+    factor = _DURATION_TO_MIN.get(unit)
+    if factor is None:
+        # Unseen spelling - resolve it once and remember the answer
+        factor = _DURATION_TO_MIN.get(unit.lower())
+        if factor is None:
+            factor = 1 / 60 if "sec" in unit.lower() else 1.0
+        _DURATION_TO_MIN[unit] = factor
+    return factor
+
+
+def distance_factor(unit: str) -> float:
+    """Multiplier converting a workout distance in `unit` to kilometers."""
+    factor = _DISTANCE_TO_KM.get(unit)
+    if factor is None:
+        factor = _DISTANCE_TO_KM.get(unit.lower())
+        if factor is None:
+            factor = 1.60934 if "mi" in unit.lower() else 1.0
+        _DISTANCE_TO_KM[unit] = factor
+    return factor
+
+
+# Merged or re-processed exports can point several workouts at one route
+@functools.lru_cache(maxsize=4096)
+def get_gpx_start_point(gpx_path: str) -> tuple[float | None, float | None]:
     """
     Extract the first track point (starting location) from a GPX file.
 
+    Scans the head of the file for the first <trkpt> tag, falling back to
+    a full XML parse if it is not found there.
+
     Returns (latitude, longitude) or (None, None) if not found.
     """
-    if not gpx_path.exists():
+    try:
+        with open(gpx_path, "rb") as f:
+            head = f.read(GPX_HEAD_BYTES)
+    except OSError:
         return None, None
 
+    match = TRKPT_RE.search(head)
+    if match:
+        lat = TRKPT_LAT_RE.search(match[1])
+        lon = TRKPT_LON_RE.search(match[1])
+        if lat and lon:
+            try:
+                return float(lat[1]), float(lon[1])
+            except ValueError:
+                pass
+
+    return parse_gpx_start_point(gpx_path)
+
+
+def parse_gpx_start_point(gpx_path: str) -> tuple[float | None, float | None]:
+    """
+    Extract the first track point from a GPX file by parsing the whole
+    document with lxml.
+
+    Returns (latitude, longitude) or (None, None) if not found.
+    """
     try:
-        tree = etree.parse(str(gpx_path))
+        tree = etree.parse(gpx_path)
         root = tree.getroot()
 
         # Try with namespace first (GPX 1.1)
@@ -107,24 +197,12 @@ def get_gpx_start_point(gpx_path: Path) -> tuple[float | None, float | None]:
     return None, None
 
 
-def get_workout_route_path(workout_elem, export_dir: Path) -> Path | None:
+def get_route_gpx_path(rel_path: str, export_dir: Path) -> str | None:
     """
-    Extract the GPX file path from a Workout element's WorkoutRoute/FileReference.
+    Resolve the path attribute of a Workout's WorkoutRoute/FileReference.
 
     Returns the full path to the GPX file, or None if not found.
     """
-    # Look for WorkoutRoute child element
-    workout_route = workout_elem.find("WorkoutRoute")
-    if workout_route is None:
-        return None
-
-    # Look for FileReference child
-    file_ref = workout_route.find("FileReference")
-    if file_ref is None:
-        return None
-
-    # Get the path attribute
-    rel_path = file_ref.get("path")
     if not rel_path:
         return None
 
@@ -133,52 +211,93 @@ def get_workout_route_path(workout_elem, export_dir: Path) -> Path | None:
     rel_path = rel_path.lstrip("/")
     gpx_path = export_dir / rel_path
 
-    return gpx_path
+    return str(gpx_path)
 
 
+def dictionary_array(values) -> pa.DictionaryArray:
+    """Build a low-cardinality string column as a DictionaryArray."""
+    return pa.array(values, pa.string()).dictionary_encode()
+
+
+# Arrow type of the dictionary-encoded string columns
+DICT_STRING = pa.dictionary(pa.int32(), pa.string())
+
 # Schema for the parquet file - now includes start_lat and start_lon
 SCHEMA = pa.schema([
-    ("type", pa.string()),
+    ("type", DICT_STRING),
     ("value", pa.float64()),
-    ("value_category", pa.string()),
-    ("unit", pa.string()),
+    ("value_category", DICT_STRING),
+    ("unit", DICT_STRING),
     ("start_date", pa.string()),
     ("end_date", pa.string()),
     ("duration_min", pa.float64()),
     ("distance_km", pa.float64()),
     ("energy_kcal", pa.float64()),
-    ("source_name", pa.string()),
+    ("source_name", DICT_STRING),
     ("start_lat", pa.float64()),
     ("start_lon", pa.float64()),
 ])
 
+# Rows per Parquet row group - matches Arrow's default 64K record batch
+ROW_GROUP_SIZE = 65536
+
+# Low-cardinality string columns worth dictionary-encoding in the file
+DICTIONARY_COLUMNS = ["type", "unit", "source_name", "value_category"]
+
+# Float64 columns buffered in preallocated NumPy arrays, and their row
+# index in those buffers
+NUMERIC_COLUMNS = ("value", "duration_min", "distance_km", "energy_kcal", "start_lat", "start_lon")
+VALUE, DURATION_MIN, DISTANCE_KM, ENERGY_KCAL, START_LAT, START_LON = range(len(NUMERIC_COLUMNS))
+
 
 def parse_and_load(xml_path: Path, parquet_path: Path, batch_size: int = 500000,
                    progress_interval: int = 500000) -> dict:
     """Parse export.xml and write to Parquet."""
+    # The numeric buffers are sized by batch_size, so it needs room for a row
+    batch_size = max(1, batch_size)
 
     # Determine export directory (parent of export.xml)
     export_dir = xml_path.parent
 
-    # Column arrays for batch processing
-    types = []
-    values = []
-    value_categories = []
-    units = []
-    start_dates = []
-    end_dates = []
-    duration_mins = []
-    distance_kms = []
-    energy_kcals = []
-    source_names = []
-    start_lats = []
-    start_lons = []
+    # String columns are kept as one tuple per row and transposed with
+    # zip(*rows) at flush time:
+    #   (type, value_category, unit, start_date, end_date, source_name)
+    # Numeric columns are written in place at row n of preallocated
+    # buffers; a null mask marks unset cells.
+    rows = []
+    # Returns one shared str per distinct unit / source name, so the
+    # buffered rows don't each hold their own copy
+    shared_str = {}.setdefault
+    # Zero-filled rather than empty so null cells never hold inf/NaN garbage
+    # when the unit scales are applied across the whole batch
+    numeric = np.zeros((len(NUMERIC_COLUMNS), batch_size), dtype=np.float64)
+    numeric_null = np.ones((len(NUMERIC_COLUMNS), batch_size), dtype=bool)
+    # Workout durations/distances are stored raw alongside their unit's
+    # conversion factor, then scaled in one vectorized pass per batch
+    duration_scale = np.ones(batch_size, dtype=np.float64)
+    distance_scale = np.ones(batch_size, dtype=np.float64)
+    n = 0
+
+    # (row, gpx_path) for workouts in the current batch; start points are
+    # resolved in parallel just before the batch is flushed
+    pending_gpx = []
+    gpx_pool = ThreadPoolExecutor(max_workers=GPX_WORKERS)
+
+    # Row of the Workout currently open, and of the one whose WorkoutRoute
+    # is open, so a nested FileReference can be attached to it
+    workout_row = None
+    route_row = None
 
     stats = {"records": 0, "workouts": 0, "workouts_with_gps": 0, "skipped": 0, "errors": 0}
     start_time = time.time()
     last_progress = 0
     writer = None
 
+    # Parquet encoding and zstd compression run on a background thread
+    # (Arrow releases the GIL) so they overlap with parsing the next batch
+    write_pool = ThreadPoolExecutor(max_workers=1)
+    pending_write = None
+
     def total_rows():
         return stats["records"] + stats["workouts"]
 
@@ -191,47 +310,84 @@ def parse_and_load(xml_path: Path, parquet_path: Path, batch_size: int = 500000,
             f"{stats['workouts']:,} workouts [{stats['workouts_with_gps']:,} with GPS], "
             f"{stats['skipped']:,} skipped) in {elapsed:.1f}s ({rate:,.0f} rows/sec)")
 
+    def set_numeric(col, value):
+        if value is not None:
+            numeric[col, n] = value
+            numeric_null[col, n] = False
+
+    def numeric_column(col):
+        # Wraps the buffer slice without copying; only the mask is converted
+        return pa.array(numeric[col, :n], mask=numeric_null[col, :n])
+
+    def resolve_gpx_points():
+        if not pending_gpx:
+            return
+
+        row_indices, paths = zip(*pending_gpx)
+        for row, (lat, lon) in zip(row_indices, gpx_pool.map(get_gpx_start_point, paths)):
+            if lat is not None:
+                stats["workouts_with_gps"] += 1
+                numeric[START_LAT, row] = lat
+                numeric_null[START_LAT, row] = False
+            if lon is not None:
+                numeric[START_LON, row] = lon
+                numeric_null[START_LON, row] = False
+        pending_gpx.clear()
+
     def flush_batch():
-        nonlocal writer, types, values, value_categories, units, start_dates, end_dates
-        nonlocal duration_mins, distance_kms, energy_kcals, source_names, start_lats, start_lons
+        nonlocal writer, pending_write, numeric, rows, n, workout_row
 
-        if not types:
+        if not n:
             return
 
+        resolve_gpx_points()
+        numeric[DURATION_MIN, :n] *= duration_scale[:n]
+        numeric[DISTANCE_KM, :n] *= distance_scale[:n]
+
+        types, value_categories, units, start_dates, end_dates, source_names = zip(*rows)
         table = pa.table({
-            "type": types,
-            "value": values,
-            "value_category": value_categories,
-            "unit": units,
-            "start_date": start_dates,
-            "end_date": end_dates,
-            "duration_min": duration_mins,
-            "distance_km": distance_kms,
-            "energy_kcal": energy_kcals,
-            "source_name": source_names,
-            "start_lat": start_lats,
-            "start_lon": start_lons,
+            "type": dictionary_array(types),
+            "value": numeric_column(VALUE),
+            "value_category": dictionary_array(value_categories),
+            "unit": dictionary_array(units),
+            "start_date": pa.array(start_dates, pa.string()),
+            "end_date": pa.array(end_dates, pa.string()),
+            "duration_min": numeric_column(DURATION_MIN),
+            "distance_km": numeric_column(DISTANCE_KM),
+            "energy_kcal": numeric_column(ENERGY_KCAL),
+            "source_name": dictionary_array(source_names),
+            "start_lat": numeric_column(START_LAT),
+            "start_lon": numeric_column(START_LON),
         }, schema=SCHEMA)
 
         if writer is None:
-            writer = pq.ParquetWriter(parquet_path, SCHEMA, compression="zstd")
-
-        writer.write_table(table)
-        print(f"  Flushed {len(types):,} rows to disk")
-
-        # Clear arrays
-        types = []
-        values = []
-        value_categories = []
-        units = []
-        start_dates = []
-        end_dates = []
-        duration_mins = []
-        distance_kms = []
-        energy_kcals = []
-        source_names = []
-        start_lats = []
-        start_lons = []
+            writer = pq.ParquetWriter(
+                parquet_path, SCHEMA,
+                compression="zstd",
+                compression_level=3,
+                use_dictionary=DICTIONARY_COLUMNS,
+                write_statistics=True,
+                data_page_size=1 << 20,
+            )
+
+        # At most one batch in flight: wait for the previous write first
+        if pending_write is not None:
+            pending_write.result()
+
+        # Split each batch into Arrow-sized row groups for finer-grained
+        # statistics and predicate pushdown on read
+        pending_write = write_pool.submit(writer.write_table, table, row_group_size=ROW_GROUP_SIZE)
+        print(f"  Flushed {n:,} rows to disk")
+
+        # Reset buffers. The table still wraps the numeric buffer while it
+        # is being written, so that one is replaced rather than reused.
+        rows = []
+        numeric = np.zeros((len(NUMERIC_COLUMNS), batch_size), dtype=np.float64)
+        numeric_null[:] = True
+        duration_scale[:] = 1.0
+        distance_scale[:] = 1.0
+        n = 0
+        workout_row = None
 
     print("Starting parse...")
     print(f"  Export directory: {export_dir}")
@@ -244,85 +400,108 @@ def parse_and_load(xml_path: Path, parquet_path: Path, batch_size: int = 500000,
     else:
         print(f"  No workout-routes folder found at {routes_dir}")
 
-    context = etree.iterparse(str(xml_path), events=("end",),
-                              tag=("Record", "Workout", "ActivitySummary", "Correlation"))
+    def next_row():
+        """Make room for one more row and report progress."""
+        nonlocal last_progress
+
+        # Flush before, not after, a row so a Workout's nested
+        # FileReference always lands in the same batch as the Workout
+        if n == batch_size:
+            flush_batch()
+
+        if total_rows() - last_progress >= progress_interval:
+            print_progress()
+            last_progress = total_rows()
+
+    def on_start(tag, attrs):
+        """Expat start-element callback - writes rows straight into the buffers."""
+        nonlocal n, workout_row, route_row
 
-    for event, elem in context:
         try:
-            if elem.tag == "Record":
-                value_numeric, value_category = parse_value(elem.get("value"))
-
-                types.append(normalize_type(elem.get("type", "")))
-                values.append(value_numeric)
-                value_categories.append(value_category)
-                units.append(elem.get("unit"))
-                start_dates.append(elem.get("startDate", "")[:19] if elem.get("startDate") else None)
-                end_dates.append(elem.get("endDate", "")[:19] if elem.get("endDate") else None)
-                duration_mins.append(None)
-                distance_kms.append(None)
-                energy_kcals.append(None)
-                source_names.append(elem.get("sourceName"))
-                start_lats.append(None)  # Records don't have GPS
-                start_lons.append(None)
+            if tag == "Record":
+                next_row()
+                value_numeric, value_category = parse_value(attrs.get("value"))
+
+                if value_numeric is not None:
+                    numeric[VALUE, n] = value_numeric
+                    numeric_null[VALUE, n] = False
+                unit = attrs.get("unit")
+                source_name = attrs.get("sourceName")
+                start_date = attrs.get("startDate")
+                end_date = attrs.get("endDate")
+                rows.append((
+                    normalize_type(attrs.get("type", "")),
+                    value_category,
+                    shared_str(unit, unit),
+                    start_date[:19] if start_date else None,
+                    end_date[:19] if end_date else None,
+                    shared_str(source_name, source_name),
+                ))
+                # Workout-only and GPS columns stay null
+                n += 1
                 stats["records"] += 1
 
-            elif elem.tag == "Workout":
-                duration_min = None
-                duration_str = elem.get("duration")
-                if duration_str:
-                    duration_min = parse_float(duration_str)
-                    duration_unit = elem.get("durationUnit", "")
-                    if duration_min and "sec" in duration_unit.lower():
-                        duration_min = duration_min / 60
-
-                distance_km = parse_float(elem.get("totalDistance"))
-                distance_unit = elem.get("totalDistanceUnit", "")
-                if distance_km and "mi" in distance_unit.lower():
-                    distance_km *= 1.60934
-
-                # Extract GPS starting point from workout route
-                start_lat, start_lon = None, None
-                gpx_path = get_workout_route_path(elem, export_dir)
-                if gpx_path:
-                    start_lat, start_lon = get_gpx_start_point(gpx_path)
-                    if start_lat is not None:
-                        stats["workouts_with_gps"] += 1
-
-                types.append(normalize_type(elem.get("workoutActivityType", "")))
-                values.append(None)
-                value_categories.append(None)
-                units.append(None)
-                start_dates.append(elem.get("startDate", "")[:19] if elem.get("startDate") else None)
-                end_dates.append(elem.get("endDate", "")[:19] if elem.get("endDate") else None)
-                duration_mins.append(duration_min)
-                distance_kms.append(distance_km)
-                energy_kcals.append(parse_float(elem.get("totalEnergyBurned")))
-                source_names.append(elem.get("sourceName"))
-                start_lats.append(start_lat)
-                start_lons.append(start_lon)
+            elif tag == "Workout":
+                next_row()
+
+                # Converted to minutes / km at flush time
+                duration_scale[n] = duration_factor(attrs.get("durationUnit", ""))
+                distance_scale[n] = distance_factor(attrs.get("totalDistanceUnit", ""))
+
+                set_numeric(DURATION_MIN, parse_float(attrs.get("duration")))
+                set_numeric(DISTANCE_KM, parse_float(attrs.get("totalDistance")))
+                set_numeric(ENERGY_KCAL, parse_float(attrs.get("totalEnergyBurned")))
+                source_name = attrs.get("sourceName")
+                start_date = attrs.get("startDate")
+                end_date = attrs.get("endDate")
+                rows.append((
+                    normalize_type(attrs.get("workoutActivityType", "")),
+                    None,
+                    None,
+                    start_date[:19] if start_date else None,
+                    end_date[:19] if end_date else None,
+                    shared_str(source_name, source_name),
+                ))
+                # GPS starting point is filled in from the route at flush time
+                workout_row = n
+                n += 1
                 stats["workouts"] += 1
 
-            elif elem.tag in ("ActivitySummary", "Correlation"):
-                stats["skipped"] += 1
+            elif tag == "WorkoutRoute":
+                # Only a route nested in the most recent row belongs to it
+                route_row = workout_row if workout_row == n - 1 else None
 
-            # Flush periodically
-            if len(types) >= batch_size:
-                flush_batch()
+            elif tag == "FileReference":
+                if route_row is not None:
+                    gpx_path = get_route_gpx_path(attrs.get("path"), export_dir)
+                    if gpx_path:
+                        pending_gpx.append((route_row, gpx_path))
+                    # First route file only
+                    workout_row = route_row = None
 
-            # Progress update
-            if total_rows() - last_progress >= progress_interval:
-                print_progress()
-                last_progress = total_rows()
+            elif tag in ("ActivitySummary", "Correlation"):
+                stats["skipped"] += 1
 
         except Exception as e:
             stats["errors"] += 1
 
-        elem.clear()
-        while elem.getprevious() is not None:
-            del elem.getparent()[0]
+    # Expat calls on_start for each element directly from C; no element
+    # objects or trees are built, so there is nothing to clear afterwards.
+    # The file is fed in large blocks rather than via ParseFile, which
+    # reads in small chunks.
+    parser = expat.ParserCreate()
+    parser.StartElementHandler = on_start
+    with open(xml_path, "rb", buffering=0) as f:
+        while chunk := f.read(READ_BUFFER_SIZE):
+            parser.Parse(chunk, False)
+        parser.Parse(b"", True)
 
     # Final flush
     flush_batch()
+    if pending_write is not None:
+        pending_write.result()
+    write_pool.shutdown()
+    gpx_pool.shutdown()
     print_progress()
 
     if writer:
@@ -7,66 +7,77 @@ DuckDB can query the Parquet file directly.
 """
 
 import argparse
+import functools
+import mmap
 import time
-from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from pathlib import Path
+from xml.parsers import expat
 
-import duckdb
-from lxml import etree
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 
 
+# Apple identifier prefixes stripped by normalize_type, keyed by the
+# character after "HK" so one dict lookup picks the only candidate,
+# along with the label that replaces the prefix
+_TYPE_PREFIXES = {
+    "Q": ("HKQuantityTypeIdentifier", ""),
+    "C": ("HKCategoryTypeIdentifier", ""),
+    "D": ("HKDataType", ""),
+    "W": ("HKWorkoutActivityType", "Workout"),
+}
+
+# Apple's category value prefixes, stripped in one regex pass per batch;
+# the longer per-category prefixes are tried before the bare one
+_CATEGORY_PREFIX_PATTERN = (
+    "^HKCategoryValue(SleepAnalysis|AppleStandHour|EnvironmentalAudioExposureEvent)?")
+
+# A value that float() would accept in practice - plain or scientific
+# decimal notation; anything else non-empty is a category value
+_NUMBER_PATTERN = r"^[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?$"
+
+
+# Few distinct identifiers repeat across millions of rows, so memoize
+@functools.lru_cache(maxsize=None)
 def normalize_type(raw_type: str) -> str:
     """
     Strip verbose Apple prefixes to make types LLM-friendly.
     """
-    prefixes = [
-        "HKQuantityTypeIdentifier",
-        "HKCategoryTypeIdentifier",
-        "HKDataType",
-        "HKWorkoutActivityType",
-    ]
-    for prefix in prefixes:
-        if raw_type.startswith(prefix):
-            result = raw_type[len(prefix):]
-            if prefix == "HKWorkoutActivityType":
-                return f"Workout{result}"
-            return result
+    entry = _TYPE_PREFIXES.get(raw_type[2:3])
+    if entry is not None and raw_type.startswith(entry[0]):
+        prefix, label = entry
+        return label + raw_type[len(prefix):]
     return raw_type
 
 
-def normalize_category_value(raw_value: str) -> str | None:
+def parse_timestamps(ts_strs: pa.StringArray) -> pa.TimestampArray:
     """
-    Strip verbose Apple prefixes from category values.
-    e.g., 'HKCategoryValueSleepAnalysisAsleepCore' -> 'AsleepCore'
+    Parse a column of Apple Health timestamps in one vectorized call.
+    Format: 2024-01-15 08:30:00 -0600 (the offset is dropped).
+    Missing or malformed values become null.
     """
-    if not raw_value:
-        return None
+    raw = pc.utf8_slice_codeunits(ts_strs, 0, 19)
+    return pc.strptime(raw, format="%Y-%m-%d %H:%M:%S", unit="us", error_is_null=True)
 
-    prefixes = [
-        "HKCategoryValueSleepAnalysis",
-        "HKCategoryValueAppleStandHour",
-        "HKCategoryValueEnvironmentalAudioExposureEvent",
-        "HKCategoryValue",
-    ]
-    for prefix in prefixes:
-        if raw_value.startswith(prefix):
-            return raw_value[len(prefix):]
-    return raw_value
-
-
-def parse_timestamp(ts_str: str) -> datetime | None:
-    """Parse Apple Health timestamp format."""
-    if not ts_str:
-        return None
-    try:
-        return datetime.strptime(ts_str[:19], "%Y-%m-%d %H:%M:%S")
-    except ValueError:
-        return None
+
+def unparsed_mask(raw: pa.Array, parsed: pa.Array) -> pa.BooleanArray:
+    """True where raw held a value that parsing turned into null."""
+    return pc.and_(pc.is_valid(raw), pc.is_null(parsed))
+
+
+# Characters a numeric value can start with. parse_float only sees workout
+# duration/totalDistance/totalEnergyBurned, which Apple writes as plain
+# decimals, so anything else is treated as missing rather than sent to float()
+_NUMBER_START = frozenset("0123456789-+.")
 
 
 def parse_float(val: str) -> float | None:
     """Safely parse a float value."""
-    if not val:
+    if not val or val[0] not in _NUMBER_START:
         return None
     try:
         return float(val)
@@ -74,183 +85,415 @@ def parse_float(val: str) -> float | None:
         return None
 
 
-def parse_value(val: str) -> tuple[float | None, str | None]:
+# Workout unit conversion factors, keyed by Apple's unit strings
+_DURATION_TO_MIN = {"s": 1 / 60, "sec": 1 / 60, "min": 1.0, "hr": 60.0}
+_DISTANCE_TO_KM = {"mi": 1.60934, "km": 1.0, "m": 0.001}
+
+
+def duration_factor(unit: str) -> float:
+    """Multiplier converting a workout duration in `unit` to minutes."""
+    factor = _DURATION_TO_MIN.get(unit)
+    if factor is None:
+        # Unseen spelling - resolve it once and remember the answer
+        factor = _DURATION_TO_MIN.get(unit.lower())
+        if factor is None:
+            factor = 1 / 60 if "sec" in unit.lower() else 1.0
+        _DURATION_TO_MIN[unit] = factor
+    return factor
+
+
+def distance_factor(unit: str) -> float:
+    """Multiplier converting a workout distance in `unit` to kilometers."""
+    factor = _DISTANCE_TO_KM.get(unit)
+    if factor is None:
+        factor = _DISTANCE_TO_KM.get(unit.lower())
+        if factor is None:
+            factor = 1.60934 if "mi" in unit.lower() else 1.0
+        _DISTANCE_TO_KM[unit] = factor
+    return factor
+
+
+def parse_values(raw_values: list[str | None]) -> tuple[pa.DoubleArray, pa.DictionaryArray]:
     """
-    Parse a value field, returning (numeric_value, category_value).
-    If it's a number, return (number, None).
-    If it's a string (category), return (None, normalized_string).
+    Split a column of raw Record values into (numeric, category) columns.
+    Numbers are cast in one call; everything else is a category value with
+    the Apple prefix stripped. Missing or empty values are null in both.
     """
-    if not val:
-        return None, None
+    raw = pa.array(raw_values, pa.string())
+    is_number = pc.match_substring_regex(raw, _NUMBER_PATTERN)
+    numeric = pc.cast(pc.if_else(is_number, raw, None), pa.float64())
+    is_category = pc.and_not(pc.not_equal(raw, ""), is_number)
+    category = pc.replace_substring_regex(
+        pc.if_else(is_category, raw, None), _CATEGORY_PREFIX_PATTERN, "", max_replacements=1)
+    return numeric, category.dictionary_encode()
 
-    # Try to parse as float first
-    try:
-        return float(val), None
-    except ValueError:
-        # It's a category value
-        return None, normalize_category_value(val)
+
+def dictionary_column(codes: list[int | None], dictionary: dict[str, int]) -> pa.DictionaryArray:
+    """Build a DictionaryArray from per-row codes and the value->code dict."""
+    return pa.DictionaryArray.from_arrays(
+        pa.array(codes, pa.int32()), pa.array(list(dictionary), pa.string()))
+
+
+# Arrow type of the dictionary-encoded string columns
+DICT_STRING = pa.dictionary(pa.int32(), pa.string())
+
+# Schema for the parquet file
+SCHEMA = pa.schema([
+    ("type", DICT_STRING),
+    ("value", pa.float64()),
+    ("value_category", DICT_STRING),
+    ("unit", DICT_STRING),
+    ("start_date", pa.timestamp("us")),
+    ("end_date", pa.timestamp("us")),
+    ("duration_min", pa.float64()),
+    ("distance_km", pa.float64()),
+    ("energy_kcal", pa.float64()),
+    ("source_name", DICT_STRING),
+])
+
+
+# Workout-only double columns, buffered in a preallocated NumPy block
+# (one row per column) instead of Python lists
+WORKOUT_COLUMNS = ("duration_min", "distance_km", "energy_kcal")
+DURATION_MIN, DISTANCE_KM, ENERGY_KCAL = range(len(WORKOUT_COLUMNS))
+
+# Low-cardinality string columns - dictionary pages shrink these a lot
+DICTIONARY_COLUMNS = ["type", "unit", "source_name", "value_category"]
+
+# Buffered rows cost roughly this much as Python objects before they are
+# converted to Arrow; batch_size is clamped so a batch stays under the cap
+BYTES_PER_ROW_ESTIMATE = 200
+MAX_BATCH_BYTES = 1 << 30
 
 
-def parse_and_load(xml_path: Path, parquet_path: Path, batch_size: int = 100000,
-                   progress_interval: int = 100000) -> dict:
+# Parallel runs cut the file into ranges of about this many bytes; each
+# worker process parses one range at a time
+RANGE_BYTES = 64 << 20
+
+# How far back find_split looks for an unclosed <Correlation> - they only
+# wrap a handful of Records, so this is generous
+CORRELATION_WINDOW = 1 << 20
+
+
+def find_split(mm: mmap.mmap, pos: int) -> int:
     """
-    Parse export.xml and write to Parquet.
+    Return the offset of the first top-level <Record tag at or after pos,
+    or len(mm) if there is none. Records nested in a Correlation are
+    passed over so a range never starts inside one.
+    """
+    size = len(mm)
+    while pos < size:
+        split = mm.find(b"<Record ", pos)
+        if split == -1:
+            return size
+        window = max(0, split - CORRELATION_WINDOW)
+        if mm.rfind(b"<Correlation ", window, split) <= mm.rfind(b"</Correlation>", window, split):
+            return split
+        close = mm.find(b"</Correlation>", split)
+        if close == -1:
+            return size
+        pos = close
+    return size
+
+
+def split_ranges(mm: mmap.mmap, range_bytes: int = RANGE_BYTES) -> list[tuple[int, int]]:
+    """Cut the mapped file into (start, end) ranges that each begin at a top-level tag."""
+    bounds = [0]
+    while True:
+        split = find_split(mm, bounds[-1] + range_bytes)
+        if split >= len(mm):
+            break
+        bounds.append(split)
+    bounds.append(len(mm))
+    return list(zip(bounds, bounds[1:]))
+
+
+def parse_range(xml_path: Path, start: int, end: int | None, batch_size: int, write_batch,
+                progress=None, progress_interval: int = 100000) -> dict:
+    """
+    Parse bytes [start, end) of export.xml (end=None means EOF), handing
+    each batch of up to batch_size rows to write_batch as an Arrow table.
 
-    Collects all rows in memory, then writes to Parquet in one pass.
-    For very large files, uses chunked writing.
+    A range that doesn't cover the whole file must come from split_ranges;
+    it is wrapped in a synthetic <HealthData> element so expat sees a
+    well-formed document.
     """
 
-    rows = []
+    # Column arrays for batch processing; values holds the raw strings,
+    # split into value/value_category at flush time
+    types = []
+    values = []
+    units = []
+    start_dates = []
+    end_dates = []
+    source_names = []
+
+    # Workout doubles are written by row index into unboxed buffers whose
+    # null mask starts all-True, so Record rows (nearly all of them) never
+    # touch these columns at all
+    workout_numeric = np.zeros((len(WORKOUT_COLUMNS), batch_size), dtype=np.float64)
+    workout_null = np.ones((len(WORKOUT_COLUMNS), batch_size), dtype=bool)
+
+    # The low-cardinality string columns hold int codes into these dicts
+    # (insertion order = code), kept for the whole run so each flush
+    # reuses the same small dictionary instead of millions of str refs
+    type_dict = {}
+    unit_dict = {}
+    source_name_dict = {}
+
     stats = {"records": 0, "workouts": 0, "skipped": 0, "errors": 0}
-    start_time = time.time()
     last_progress = 0
-    chunk_num = 0
-    temp_parquets = []
 
     def total_rows():
         return stats["records"] + stats["workouts"]
 
-    def print_progress():
+    def set_workout_value(col, row, value):
+        if value is not None:
+            workout_numeric[col, row] = value
+            workout_null[col, row] = False
+
+    def workout_column(col, n):
+        return pa.array(workout_numeric[col, :n], mask=workout_null[col, :n])
+
+    def flush_to_parquet():
+        nonlocal workout_numeric
+        n = len(types)
+        if not n:
+            return
+
+        # Bad values already became nulls in the per-row handlers and the
+        # vectorized parsers (counted as errors below), so a failure while
+        # building the table is a bug and is not caught
+        value, value_category = parse_values(values)
+        start_raw = pa.array(start_dates, pa.string())
+        end_raw = pa.array(end_dates, pa.string())
+        start_date = parse_timestamps(start_raw)
+        end_date = parse_timestamps(end_raw)
+
+        # Malformed dates are stored as null; count each affected row once.
+        # Every non-empty value is either numeric or a category, so values
+        # can't fail this way
+        stats["errors"] += pc.sum(pc.or_(unparsed_mask(start_raw, start_date),
+                                         unparsed_mask(end_raw, end_date))).as_py()
+
+        write_batch(pa.Table.from_pydict({
+            "type": dictionary_column(types, type_dict),
+            "value": value,
+            "value_category": value_category,
+            "unit": dictionary_column(units, unit_dict),
+            "start_date": start_date,
+            "end_date": end_date,
+            "duration_min": workout_column(DURATION_MIN, n),
+            "distance_km": workout_column(DISTANCE_KM, n),
+            "energy_kcal": workout_column(ENERGY_KCAL, n),
+            "source_name": dictionary_column(source_names, source_name_dict),
+        }, schema=SCHEMA))
+
+        # Cleared in place - the parse loop holds bound append methods
+        for column in (types, values, units, start_dates, end_dates, source_names):
+            column.clear()
+        # The table may still wrap the numeric buffer (parallel workers keep
+        # their tables until the range is done), so start a fresh one
+        workout_numeric = np.zeros((len(WORKOUT_COLUMNS), batch_size), dtype=np.float64)
+        workout_null[:] = True
+
+    # The handler runs once per element of a multi-GB file, so bind the
+    # functions and methods it calls to locals once (closure loads instead
+    # of a global or attribute lookup per call)
+    _normalize_type = normalize_type
+    _parse_float = parse_float
+    _duration_factor = duration_factor
+    _distance_factor = distance_factor
+    append_type = types.append
+    append_value = values.append
+    append_unit = units.append
+    append_start_date = start_dates.append
+    append_end_date = end_dates.append
+    append_source_name = source_names.append
+
+    def handle_record(attrib):
+        get = attrib.get
+        type_ = _normalize_type(get("type", ""))
+        unit = get("unit")
+        source_name = get("sourceName")
+
+        append_type(type_dict.setdefault(type_, len(type_dict)))
+        append_value(get("value"))
+        append_unit(None if unit is None else unit_dict.setdefault(unit, len(unit_dict)))
+        append_start_date(get("startDate"))
+        append_end_date(get("endDate"))
+        append_source_name(None if source_name is None else
+                           source_name_dict.setdefault(source_name, len(source_name_dict)))
+        stats["records"] += 1
+
+    def handle_workout(attrib):
+        get = attrib.get
+        duration_min = _parse_float(get("duration"))
+        if duration_min:
+            duration_min *= _duration_factor(get("durationUnit", ""))
+
+        distance_km = _parse_float(get("totalDistance"))
+        if distance_km:
+            distance_km *= _distance_factor(get("totalDistanceUnit", ""))
+
+        type_ = _normalize_type(get("workoutActivityType", ""))
+        source_name = get("sourceName")
+
+        row = len(types)
+        set_workout_value(DURATION_MIN, row, duration_min)
+        set_workout_value(DISTANCE_KM, row, distance_km)
+        set_workout_value(ENERGY_KCAL, row, _parse_float(get("totalEnergyBurned")))
+
+        append_type(type_dict.setdefault(type_, len(type_dict)))
+        append_value(None)
+        append_unit(None)
+        append_start_date(get("startDate"))
+        append_end_date(get("endDate"))
+        append_source_name(None if source_name is None else
+                           source_name_dict.setdefault(source_name, len(source_name_dict)))
+        stats["workouts"] += 1
+
+    def skip(attrib):
+        # Skip computed/derived data
+        stats["skipped"] += 1
+
+    # One dict lookup per start tag picks the handler; every other tag
+    # (MetadataEntry, HeartRateVariability..., the root) misses and returns
+    dispatch_get = {
+        "Record": handle_record,
+        "Workout": handle_workout,
+        "ActivitySummary": skip,
+        "Correlation": skip,
+    }.get
+
+    def on_start(tag, attrib):
+        """Expat start-element callback - dispatches Record/Workout rows."""
+        nonlocal last_progress
+
+        handler = dispatch_get(tag)
+        if handler is None:
+            return
+
+        handler(attrib)
+
+        # Flush to parquet periodically to avoid memory issues
+        if len(types) >= batch_size:
+            flush_to_parquet()
+
+        # Progress update
+        if progress is not None and total_rows() - last_progress >= progress_interval:
+            progress(stats)
+            last_progress = total_rows()
+
+    # Expat calls on_start straight from C with a plain attribute dict; no
+    # Element objects are built, so there is no tree to clear as we go.
+    # The file is mapped rather than read, so expat scans the page cache
+    # directly without copying it through Python read buffers.
+    parser = expat.ParserCreate()
+    parser.StartElementHandler = on_start
+    with open(xml_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        size = len(mm)
+        if end is None:
+            end = size
+        if start > 0:
+            parser.Parse(b"<HealthData>", False)
+        with memoryview(mm) as view, view[start:end] as data:
+            parser.Parse(data, end == size)
+        if end < size:
+            parser.Parse(b"</HealthData>", True)
+
+    # Final flush
+    flush_to_parquet()
+    if progress is not None:
+        progress(stats)
+
+    return stats
+
+
+def parse_range_tables(xml_path: Path, start: int, end: int, batch_size: int) -> tuple[list[pa.Table], dict]:
+    """Worker entry point - parse one range and return its batches and stats."""
+    tables = []
+    stats = parse_range(xml_path, start, end, batch_size, tables.append)
+    return tables, stats
+
+
+def parse_and_load(xml_path: Path, parquet_path: Path, batch_size: int = 1_000_000,
+                   progress_interval: int = 100000, workers: int = 1) -> dict:
+    """
+    Parse export.xml and write to Parquet.
+
+    Rows are buffered in batches of batch_size and each batch is written
+    to a single Parquet file as its own row group. With workers > 1 the
+    file is split into byte ranges parsed by a process pool, and their
+    batches are written in file order.
+    """
+    batch_size = max(1, min(batch_size, MAX_BATCH_BYTES // BYTES_PER_ROW_ESTIMATE))
+
+    start_time = time.time()
+    chunk_num = 0
+
+    def print_progress(stats):
         elapsed = time.time() - start_time
-        total = total_rows()
+        total = stats["records"] + stats["workouts"]
         rate = total / elapsed if elapsed > 0 else 0
         print(
             f"  Processed {total:,} rows ({stats['records']:,} records, {stats['workouts']:,} workouts, {stats['skipped']:,} skipped) "
             f"in {elapsed:.1f}s ({rate:,.0f} rows/sec)")
 
-    def flush_to_parquet():
-        nonlocal chunk_num, rows
-        if not rows:
-            return
-
-        conn = duckdb.connect()
-
-        # Create table from rows
-        conn.execute("""
-            CREATE TABLE chunk (
-                type VARCHAR,
-                value DOUBLE,
-                value_category VARCHAR,
-                unit VARCHAR,
-                start_date TIMESTAMP,
-                end_date TIMESTAMP,
-                duration_min DOUBLE,
-                distance_km DOUBLE,
-                energy_kcal DOUBLE,
-                source_name VARCHAR
-            )
-        """)
-
-        conn.executemany("INSERT INTO chunk VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
-
-        # Write chunk to temp parquet
-        chunk_path = parquet_path.parent / f".chunk_{chunk_num}.parquet"
-        conn.execute(f"COPY chunk TO '{chunk_path}' (FORMAT PARQUET, COMPRESSION ZSTD)")
-        temp_parquets.append(chunk_path)
-
-        conn.close()
-        rows = []
+    def write_batch(table):
+        nonlocal chunk_num
+        # One row group per batch - DuckDB scans row groups in parallel
+        writer.write_table(table, row_group_size=batch_size)
         chunk_num += 1
         print(f"  Flushed chunk {chunk_num} to disk")
 
     print("Starting parse...")
 
-    # Use lxml's iterparse for faster parsing
-    context = etree.iterparse(str(xml_path), events=("end",),
-                              tag=("Record", "Workout", "ActivitySummary", "Correlation"))
-
-    for event, elem in context:
-        try:
-            if elem.tag == "Record":
-                value_numeric, value_category = parse_value(elem.get("value"))
-
-                row = (
-                    normalize_type(elem.get("type", "")),
-                    value_numeric,
-                    value_category,
-                    elem.get("unit"),
-                    parse_timestamp(elem.get("startDate")),
-                    parse_timestamp(elem.get("endDate")),
-                    None,
-                    None,
-                    None,
-                    elem.get("sourceName"),
-                )
-                rows.append(row)
-                stats["records"] += 1
-
-            elif elem.tag == "Workout":
-                duration_min = None
-                duration_str = elem.get("duration")
-                if duration_str:
-                    duration_min = parse_float(duration_str)
-                    duration_unit = elem.get("durationUnit", "")
-                    if "sec" in duration_unit.lower():
-                        duration_min = duration_min / 60 if duration_min else None
-
-                distance_km = parse_float(elem.get("totalDistance"))
-                distance_unit = elem.get("totalDistanceUnit", "")
-                if distance_km and "mi" in distance_unit.lower():
-                    distance_km *= 1.60934
-
-                row = (
-                    normalize_type(elem.get("workoutActivityType", "")),
-                    None,
-                    None,
-                    None,
-                    parse_timestamp(elem.get("startDate")),
-                    parse_timestamp(elem.get("endDate")),
-                    duration_min,
-                    distance_km,
-                    parse_float(elem.get("totalEnergyBurned")),
-                    elem.get("sourceName"),
-                )
-                rows.append(row)
-                stats["workouts"] += 1
-
-            elif elem.tag in ("ActivitySummary", "Correlation"):
-                # Skip computed/derived data
-                stats["skipped"] += 1
-
-            # Flush to parquet periodically to avoid memory issues
-            if len(rows) >= batch_size:
-                flush_to_parquet()
-
-            # Progress update
-            if total_rows() - last_progress >= progress_interval:
-                print_progress()
-                last_progress = total_rows()
-
-        except Exception as e:
-            stats["errors"] += 1
-
-        # Clear element and its ancestors to free memory
-        elem.clear()
-        while elem.getprevious() is not None:
-            del elem.getparent()[0]
-
-    # Final flush
-    flush_to_parquet()
-    print_progress()
-
-    # Merge all chunks into final parquet
-    print("Merging chunks into final parquet...")
-    conn = duckdb.connect()
+    # Single writer for the whole run - each flush appends a row group, so
+    # there are no temp chunk files to merge afterwards
+    writer = pq.ParquetWriter(parquet_path, SCHEMA, compression="zstd",
+                              use_dictionary=DICTIONARY_COLUMNS)
 
-    if len(temp_parquets) == 1:
-        # Just rename if single chunk
-        temp_parquets[0].rename(parquet_path)
+    if workers <= 1:
+        stats = parse_range(xml_path, 0, None, batch_size, write_batch,
+                            print_progress, progress_interval)
     else:
-        # Merge multiple chunks
-        chunk_pattern = str(parquet_path.parent / ".chunk_*.parquet")
-        conn.execute(
-            f"COPY (SELECT * FROM read_parquet('{chunk_pattern}')) TO '{parquet_path}' (FORMAT PARQUET, COMPRESSION ZSTD)")
-
-        # Clean up temp files
-        for p in temp_parquets:
-            p.unlink()
-
-    conn.close()
+        with open(xml_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            ranges = split_ranges(mm)
+        print(f"  Split into {len(ranges)} ranges across {workers} workers")
+
+        stats = {"records": 0, "workouts": 0, "skipped": 0, "errors": 0}
+        # Ranges are smaller than a batch, so regroup their tables into
+        # batch_size row groups before writing
+        pending = []
+        pending_rows = 0
+        last_progress = 0
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            starts, ends = zip(*ranges)
+            results = pool.map(parse_range_tables, repeat(xml_path), starts, ends, repeat(batch_size))
+            for tables, range_stats in results:
+                for key, count in range_stats.items():
+                    stats[key] += count
+                pending.extend(tables)
+                pending_rows += sum(table.num_rows for table in tables)
+                if pending_rows >= batch_size:
+                    # Write only whole batches; the remainder stays pending
+                    # so every row group but the last is exactly batch_size
+                    combined = pa.concat_tables(pending)
+                    while combined.num_rows >= batch_size:
+                        write_batch(combined.slice(0, batch_size))
+                        combined = combined.slice(batch_size)
+                    pending = [combined]
+                    pending_rows = combined.num_rows
+                total = stats["records"] + stats["workouts"]
+                if total - last_progress >= progress_interval:
+                    print_progress(stats)
+                    last_progress = total
+        if pending_rows:
+            write_batch(pa.concat_tables(pending))
+        print_progress(stats)
+
+    writer.close()
 
     return stats
 
@@ -273,8 +516,14 @@ def main():
     parser.add_argument(
         "--batch-size",
         type=int,
-        default=100000,
-        help="Rows per chunk (default: 100000)"
+        default=1_000_000,
+        help="Rows per Parquet row group (default: 1000000)"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Parser processes; >1 splits the file into byte ranges (default: 1)"
     )
     parser.add_argument(
         "--progress",
@@ -290,7 +539,7 @@ def main():
         return 1
 
     print(f"Parsing {args.xml_path}...")
-    stats = parse_and_load(args.xml_path, args.output, args.batch_size, args.progress)
+    stats = parse_and_load(args.xml_path, args.output, args.batch_size, args.progress, args.workers)
 
     print(f"\nDone! Wrote {args.output}")
     print(f"  Records:  {stats['records']:,}")